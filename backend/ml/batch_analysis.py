@@ -0,0 +1,413 @@
+"""Offline analysis of recorded footage.
+
+The video is split into fixed-length time chunks that a process pool scans in
+parallel. Each worker runs the frames it samples through YOLO in batches and
+writes one detection record per frame to a part file under the job's work
+directory. A finished part file is the checkpoint for its chunk, so running the
+same job again skips chunks that are already done. When every chunk is
+finished, the parts are merged in order into a single JSONL or Parquet file,
+and crowd/weapon alerts are raised during that pass using the same rules and
+cooldown as the live pipeline in ``ai_server.py``.
+
+Usage::
+
+    python -m ml.batch_analysis samples/demo.mp4 -o out/demo.jsonl --workers 4
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import json
+import os
+import time
+import cv2
+from .yolo_inference import InferenceEngine, YOLO
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:
+    pa = None  # Parquet output is only available when pyarrow is installed
+    pq = None
+
+# Alert rules mirror ai_server.generate_frames.
+WEAPON_LABELS = {"baseball bat", "knife", "scissors"}
+PERSON_CONF = 0.50
+CROWD_THRESHOLD = 5
+ALERT_COOLDOWN_S = 5.0
+
+MANIFEST_NAME = "manifest.json"
+
+# Nested fields (detections, metadata) are stored as JSON strings in Parquet.
+PARQUET_FIELDS = [
+    ("type", "string"),
+    ("camera_id", "string"),
+    ("frame", "int64"),
+    ("video_ts", "float64"),
+    ("count", "int64"),
+    ("detections", "string"),
+    ("event_type", "string"),
+    ("severity", "string"),
+    ("metadata", "string"),
+]
+
+_engine: Optional[InferenceEngine] = None
+
+
+def probe_video(path: str) -> Dict[str, float]:
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    finally:
+        cap.release()
+    if fps <= 0 or frame_count <= 0:
+        raise ValueError(f"Could not read frame rate / length of: {path}")
+    return {"fps": fps, "frame_count": frame_count, "duration": frame_count / fps}
+
+
+def plan_chunks(frame_count: int, fps: float, chunk_seconds: float) -> List[Tuple[int, int, int]]:
+    """Returns ``(index, start_frame, end_frame)`` for each chunk; ``end_frame`` is exclusive."""
+    if chunk_seconds <= 0:
+        raise ValueError("chunk_seconds must be positive")
+    step = max(1, int(round(chunk_seconds * fps)))
+    return [
+        (i, start, min(start + step, frame_count))
+        for i, start in enumerate(range(0, frame_count, step))
+    ]
+
+
+def _init_worker(model_path: str, device: Optional[str], threads: int) -> None:
+    global _engine
+    # Parallelism comes from the pool; keep each process to its share of the cores.
+    cv2.setNumThreads(1)
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    _engine = InferenceEngine(model_path=model_path, device=device)
+    if _engine.model is None:
+        raise RuntimeError("ultralytics is not installed; cannot run batch analysis")
+
+
+def _sampled_frames(path: str, start: int, end: int, stride: int) -> Iterator[Tuple[int, Any]]:
+    cap = cv2.VideoCapture(path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for idx in range(start, end):
+            # With the FFmpeg backend grab() still decodes every frame; retrieve()
+            # only converts it to BGR. The stride saves inference, not decoding.
+            if not cap.grab():
+                break
+            if (idx - start) % stride:
+                continue
+            ok, frame = cap.retrieve()
+            if ok:
+                yield idx, frame
+    finally:
+        cap.release()
+
+
+def _detection_record(idx: int, fps: float, camera_id: str, pred: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "detection",
+        "camera_id": camera_id,
+        "frame": idx,
+        "video_ts": round(idx / fps, 3),
+        "count": int(pred.get("count", 0)),
+        "detections": pred.get("detections", []),
+    }
+
+
+def _alerts(
+    rec: Dict[str, Any],
+    last_alert: Dict[str, float],
+    crowd_threshold: int = CROWD_THRESHOLD,
+    cooldown: float = ALERT_COOLDOWN_S,
+) -> List[Dict[str, Any]]:
+    """Alerts raised by one detection record.
+
+    ``last_alert`` maps an alert key to the video time it last fired and is
+    updated in place, so records must be fed in video order.
+    """
+    ts = rec["video_ts"]
+    base = {
+        "type": "alert",
+        "camera_id": rec["camera_id"],
+        "frame": rec["frame"],
+        "video_ts": ts,
+        "count": rec["count"],
+    }
+    out: List[Dict[str, Any]] = []
+    if crowd_threshold > 0 and rec["count"] >= crowd_threshold:
+        if ts - last_alert.get("crowd", float("-inf")) > cooldown:
+            out.append({**base, "event_type": "crowd_surge", "severity": "high",
+                        "metadata": {"threshold": crowd_threshold}})
+            last_alert["crowd"] = ts
+    weapons = sorted({d["label"] for d in rec["detections"] if d.get("label") in WEAPON_LABELS})
+    for label in weapons:
+        if ts - last_alert.get(label, float("-inf")) > cooldown:
+            out.append({**base, "event_type": "weapon_detected", "severity": "high",
+                        "metadata": {"label": label}})
+            last_alert[label] = ts
+    return out
+
+
+def _process_chunk(task: Dict[str, Any]) -> Dict[str, Any]:
+    assert _engine is not None, "worker not initialised"
+    started = time.perf_counter()
+    part_path = task["part_path"]
+    tmp_path = part_path + ".tmp"
+    frames: List[Any] = []
+    indices: List[int] = []
+    sampled = 0
+    failed = 0
+
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        def flush() -> None:
+            nonlocal failed
+            preds = _engine.predict_batch(frames, conf=task["conf"], person_conf=PERSON_CONF)
+            for i, pred in zip(indices, preds):
+                if pred is None:
+                    failed += 1
+                    continue
+                fh.write(json.dumps(_detection_record(i, task["fps"], task["camera_id"], pred)) + "\n")
+            frames.clear()
+            indices.clear()
+
+        for idx, frame in _sampled_frames(task["source"], task["start"], task["end"], task["stride"]):
+            frames.append(frame)
+            indices.append(idx)
+            sampled += 1
+            if len(frames) >= task["batch_size"]:
+                flush()
+        if frames:
+            flush()
+
+    # Rename last so an interrupted chunk never looks finished.
+    os.replace(tmp_path, part_path)
+    return {
+        "index": task["index"],
+        "frames": sampled,
+        "failed_frames": failed,
+        "video_seconds": (task["end"] - task["start"]) / task["fps"],
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def _load_manifest(work_dir: str, params: Dict[str, Any]) -> None:
+    path = os.path.join(work_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as fh:
+            previous = json.load(fh)
+        if previous != params:
+            raise ValueError(
+                f"{work_dir} holds a checkpoint for a different job; "
+                "use another --work-dir or delete it to start over"
+            )
+        return
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(params, fh, indent=2)
+
+
+def _iter_records(part_paths: List[str], crowd_threshold: int, cooldown: float) -> Iterator[Dict[str, Any]]:
+    last_alert: Dict[str, float] = {}
+    for part in part_paths:
+        with open(part, encoding="utf-8") as fh:
+            for line in fh:
+                rec = json.loads(line)
+                yield rec
+                yield from _alerts(rec, last_alert, crowd_threshold, cooldown)
+
+
+def _merge_parts(
+    part_paths: List[str],
+    output: str,
+    crowd_threshold: int = CROWD_THRESHOLD,
+    cooldown: float = ALERT_COOLDOWN_S,
+) -> Dict[str, int]:
+    rows = 0
+    alerts = 0
+    tmp = output + ".tmp"
+    records = _iter_records(part_paths, crowd_threshold, cooldown)
+
+    if output.endswith(".parquet"):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Parquet output")
+        schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in PARQUET_FIELDS])
+        columns: Dict[str, List[Any]] = {name: [] for name, _ in PARQUET_FIELDS}
+        for rec in records:
+            rows += 1
+            alerts += rec["type"] == "alert"
+            for name, _ in PARQUET_FIELDS:
+                value = rec.get(name)
+                if name in ("detections", "metadata") and value is not None:
+                    value = json.dumps(value)
+                columns[name].append(value)
+        pq.write_table(pa.Table.from_pydict(columns, schema=schema), tmp)
+    else:
+        with open(tmp, "w", encoding="utf-8") as out:
+            for rec in records:
+                rows += 1
+                alerts += rec["type"] == "alert"
+                out.write(json.dumps(rec) + "\n")
+    os.replace(tmp, output)
+    return {"records": rows, "alerts": alerts}
+
+
+def run_batch_job(
+    source: str,
+    output: str,
+    work_dir: Optional[str] = None,
+    chunk_seconds: float = 60.0,
+    sample_fps: float = 5.0,
+    batch_size: int = 16,
+    workers: Optional[int] = None,
+    model_path: str = "yolov8n.pt",
+    device: Optional[str] = None,
+    conf: float = 0.25,
+    crowd_threshold: int = CROWD_THRESHOLD,
+    camera_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Analyses ``source`` and writes detections/alerts to ``output``.
+
+    Returns a summary including ``throughput``, the number of video seconds
+    processed per wall-clock second in this run (resumed chunks excluded).
+    """
+    if chunk_seconds <= 0:
+        raise ValueError("chunk_seconds must be positive")
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive")
+    if workers is not None and workers <= 0:
+        raise ValueError("workers must be positive")
+    if YOLO is None:
+        raise RuntimeError("ultralytics is not installed; cannot run batch analysis")
+    if output.endswith(".parquet") and pa is None:
+        raise RuntimeError("pyarrow is required for Parquet output")
+
+    info = probe_video(source)
+    fps = info["fps"]
+    stride = max(1, int(round(fps / sample_fps))) if sample_fps > 0 else 1
+    camera_id = camera_id or os.path.splitext(os.path.basename(source))[0]
+    work_dir = work_dir or output + ".parts"
+    os.makedirs(work_dir, exist_ok=True)
+    output_dir = os.path.dirname(os.path.abspath(output))
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Only what changes the part files belongs here; alert settings apply at merge.
+    _load_manifest(work_dir, {
+        "source": os.path.abspath(source),
+        "frame_count": info["frame_count"],
+        "chunk_seconds": chunk_seconds,
+        "stride": stride,
+        "model_path": model_path,
+        "conf": conf,
+        "person_conf": PERSON_CONF,
+        "camera_id": camera_id,
+    })
+
+    chunks = plan_chunks(info["frame_count"], fps, chunk_seconds)
+    part_paths = [os.path.join(work_dir, f"chunk-{i:05d}.jsonl") for i, _, _ in chunks]
+    pending = [
+        {
+            "index": i,
+            "source": source,
+            "start": start,
+            "end": end,
+            "stride": stride,
+            "fps": fps,
+            "batch_size": batch_size,
+            "conf": conf,
+            "camera_id": camera_id,
+            "part_path": part_paths[i],
+        }
+        for i, start, end in chunks
+        if not os.path.exists(part_paths[i])
+    ]
+
+    started = time.perf_counter()
+    video_seconds = 0.0
+    frames = 0
+    failed = 0
+    if pending:
+        cpus = os.cpu_count() or 1
+        max_workers = min(workers or cpus, len(pending))
+        threads = max(1, cpus // max_workers)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(model_path, device, threads),
+        ) as pool:
+            futures = [pool.submit(_process_chunk, task) for task in pending]
+            for fut in as_completed(futures):
+                res = fut.result()
+                video_seconds += res["video_seconds"]
+                frames += res["frames"]
+                failed += res["failed_frames"]
+                elapsed = time.perf_counter() - started
+                print(
+                    f"chunk {res['index'] + 1}/{len(chunks)} done "
+                    f"({video_seconds / elapsed:.2f} video-s/s)",
+                    flush=True,
+                )
+    elapsed = time.perf_counter() - started
+
+    merged = _merge_parts(part_paths, output, crowd_threshold)
+    return {
+        "output": output,
+        "chunks": len(chunks),
+        "resumed_chunks": len(chunks) - len(pending),
+        "frames_analysed": frames,
+        "failed_frames": failed,
+        "records": merged["records"],
+        "alerts": merged["alerts"],
+        "video_seconds": round(video_seconds, 3),
+        "wall_seconds": round(elapsed, 3),
+        "throughput": round(video_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Scan recorded footage for detections and alerts.")
+    parser.add_argument("source", help="video file, e.g. samples/demo.mp4")
+    parser.add_argument("-o", "--output", required=True, help="results file (.jsonl or .parquet)")
+    parser.add_argument("--work-dir", default=None, help="checkpoint directory (default: <output>.parts)")
+    parser.add_argument("--chunk-seconds", type=float, default=60.0)
+    parser.add_argument("--sample-fps", type=float, default=5.0, help="frames analysed per video second (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count); torch threads are split between them")
+    parser.add_argument("--model", default=os.getenv("YOLO_MODEL", "yolov8n.pt"))
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--crowd-threshold", type=int, default=int(os.getenv("CROWD_THRESHOLD", str(CROWD_THRESHOLD))), help="people for a crowd alert (0 = off)")
+    parser.add_argument("--camera-id", default=os.getenv("CAMERA_ID"))
+    args = parser.parse_args(argv)
+
+    if args.chunk_seconds <= 0:
+        parser.error("--chunk-seconds must be positive")
+    if args.batch_size <= 0:
+        parser.error("--batch-size must be positive")
+    if args.workers is not None and args.workers <= 0:
+        parser.error("--workers must be positive")
+
+    summary = run_batch_job(
+        source=args.source,
+        output=args.output,
+        work_dir=args.work_dir,
+        chunk_seconds=args.chunk_seconds,
+        sample_fps=args.sample_fps,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        model_path=args.model,
+        device=args.device,
+        conf=args.conf,
+        crowd_threshold=args.crowd_threshold,
+        camera_id=args.camera_id,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
-from typing import Generator, Optional, Dict, Any, Iterable
+from typing import Generator, Optional, Dict, Any, Iterable, List
 import os
 import time
 import json
+import logging
 import cv2
-from ..core.redis_client import get_sync_redis
 
 try:
     from ultralytics import YOLO  # type: ignore
 except Exception:
     YOLO = None  # fallback for environments without ultralytics installed
 
+logger = logging.getLogger(__name__)
+
 class InferenceEngine:
     def __init__(self, model_path: str = "yolov8n.pt", device: Optional[str] = None) -> None:
         self.model_path = model_path
@@ -35,22 +37,57 @@ class InferenceEngine:
         count = 0
         try:
             for r in results:  # ultralytics returns iterable
-                names = r.names if hasattr(r, 'names') else {}
-                boxes = r.boxes if hasattr(r, 'boxes') else None
-                if boxes is None:
-                    continue
-                for b in boxes:
-                    cls = int(b.cls)
-                    label = names.get(cls, str(cls))
-                    if label == 'person' or cls == 0:
-                        count += 1
+                count += self._summarize(r)["count"]
         except Exception:
             pass
         return {"count": count}
 
+    def predict_batch(self, frames: List[Any], conf: float = 0.25, person_conf: float = 0.0) -> List[Optional[Dict[str, Any]]]:
+        """Runs one forward pass over ``frames``; returns one summary per frame.
+
+        A frame whose result cannot be read is logged and returned as ``None``.
+        """
+        if self.model is None:
+            raise RuntimeError("ultralytics is not installed; cannot run inference")
+        if not frames:
+            return []
+        results = self.model(frames, verbose=False, conf=conf, device=self.device)
+        summaries: List[Optional[Dict[str, Any]]] = []
+        for r in results:
+            try:
+                summaries.append(self._summarize(r, person_conf))
+            except Exception:
+                logger.exception("Could not read detection result")
+                summaries.append(None)
+        return summaries
+
+    @staticmethod
+    def _summarize(result, person_conf: float = 0.0) -> Dict[str, Any]:
+        """People with confidence above ``person_conf`` are counted; every box is listed."""
+        names = result.names if hasattr(result, 'names') else {}
+        boxes = result.boxes if hasattr(result, 'boxes') else None
+        count = 0
+        detections: List[Dict[str, Any]] = []
+        if boxes is None:
+            return {"count": count, "detections": detections}
+        for b in boxes:
+            cls = int(b.cls)
+            label = names.get(cls, str(cls))
+            conf = float(b.conf)
+            if (label == 'person' or cls == 0) and conf > person_conf:
+                count += 1
+            detections.append({
+                "label": label,
+                "confidence": round(conf, 4),
+                "bbox": [round(float(v), 1) for v in b.xyxy[0].tolist()],
+            })
+        return {"count": count, "detections": detections}
 
 def run_crowd_worker() -> None:
     """Continuously reads frames, counts people, and publishes Redis alerts."""
+    # Imported here so offline batch analysis can use the engine without Redis.
+    from ..core.redis_client import get_sync_redis
+
     source = os.getenv("VIDEO_SOURCE", "0")
     try:
         src: int | str = int(source)
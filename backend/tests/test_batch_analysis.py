@@ -0,0 +1,164 @@
+import json
+import types
+
+import pytest
+
+pytest.importorskip("cv2")
+
+from ml import batch_analysis as ba  # noqa: E402
+from ml.yolo_inference import InferenceEngine  # noqa: E402
+
+
+def _det(frame, ts, count=0, labels=(), camera_id="cam"):
+    return {
+        "type": "detection",
+        "camera_id": camera_id,
+        "frame": frame,
+        "video_ts": ts,
+        "count": count,
+        "detections": [{"label": l, "confidence": 0.9, "bbox": [0, 0, 1, 1]} for l in labels],
+    }
+
+
+def _write_part(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+    return str(path)
+
+
+# --- plan_chunks -----------------------------------------------------------
+
+def test_plan_chunks_last_chunk_is_partial():
+    assert ba.plan_chunks(250, 25.0, 4) == [(0, 0, 100), (1, 100, 200), (2, 200, 250)]
+
+
+def test_plan_chunks_tiny_chunk_is_one_frame():
+    assert ba.plan_chunks(3, 25.0, 0.001) == [(0, 0, 1), (1, 1, 2), (2, 2, 3)]
+
+
+@pytest.mark.parametrize("seconds", [0, -1])
+def test_plan_chunks_rejects_non_positive(seconds):
+    with pytest.raises(ValueError):
+        ba.plan_chunks(100, 25.0, seconds)
+
+
+# --- alerts ----------------------------------------------------------------
+
+def test_alerts_crowd_uses_threshold_and_cooldown():
+    last = {}
+    assert ba._alerts(_det(0, 0.0, count=4), last) == []
+    first = ba._alerts(_det(1, 1.0, count=5), last)
+    assert [a["event_type"] for a in first] == ["crowd_surge"]
+    assert ba._alerts(_det(2, 5.0, count=9), last) == []
+    assert len(ba._alerts(_det(3, 6.5, count=9), last)) == 1
+
+
+def test_alerts_weapons_throttled_per_label():
+    last = {}
+    out = ba._alerts(_det(0, 0.0, labels=("knife", "knife", "person")), last)
+    assert [a["metadata"]["label"] for a in out] == ["knife"]
+    out = ba._alerts(_det(1, 1.0, labels=("knife", "scissors")), last)
+    assert [a["metadata"]["label"] for a in out] == ["scissors"]
+
+
+def test_alerts_crowd_disabled_with_zero_threshold():
+    assert ba._alerts(_det(0, 0.0, count=50), {}, crowd_threshold=0) == []
+
+
+# --- manifest --------------------------------------------------------------
+
+def test_manifest_resume_and_mismatch(tmp_path):
+    params = {"source": "a.mp4", "stride": 5}
+    ba._load_manifest(str(tmp_path), params)
+    ba._load_manifest(str(tmp_path), dict(params))
+    with pytest.raises(ValueError):
+        ba._load_manifest(str(tmp_path), {**params, "stride": 1})
+
+
+# --- merge -----------------------------------------------------------------
+
+def _parts(tmp_path):
+    return [
+        _write_part(tmp_path / "chunk-00000.jsonl", [_det(0, 0.0, count=6), _det(5, 0.2, count=7)]),
+        _write_part(tmp_path / "chunk-00001.jsonl", [_det(10, 0.4, labels=("knife",))]),
+    ]
+
+
+def test_merge_jsonl_keeps_order_and_collapses_alerts(tmp_path):
+    out = tmp_path / "out.jsonl"
+    stats = ba._merge_parts(_parts(tmp_path), str(out))
+    rows = [json.loads(l) for l in out.read_text(encoding="utf-8").splitlines()]
+    assert [(r["type"], r["frame"]) for r in rows] == [
+        ("detection", 0), ("alert", 0), ("detection", 5), ("detection", 10), ("alert", 10),
+    ]
+    assert stats == {"records": 5, "alerts": 2}
+    assert not (tmp_path / "out.jsonl.tmp").exists()
+
+
+def test_merge_parquet_keeps_alert_fields(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out = tmp_path / "out.parquet"
+    ba._merge_parts(_parts(tmp_path), str(out))
+    rows = pq.read_table(str(out)).to_pylist()
+    alerts = [r for r in rows if r["type"] == "alert"]
+    assert [a["event_type"] for a in alerts] == ["crowd_surge", "weapon_detected"]
+    assert json.loads(alerts[1]["metadata"]) == {"label": "knife"}
+    assert json.loads(rows[0]["detections"]) == []
+
+
+# --- workers ---------------------------------------------------------------
+
+class FakeEngine:
+    model = object()
+
+    def __init__(self, model_path="", device=None):
+        pass
+
+    def predict_batch(self, frames, conf=0.25, person_conf=0.0):
+        return [None if f == "bad" else {"count": f, "detections": []} for f in frames]
+
+
+def test_process_chunk_batches_and_skips_failed_frames(tmp_path, monkeypatch):
+    frames = {0: 1, 2: "bad", 4: 3}
+    monkeypatch.setattr(ba, "_engine", FakeEngine())
+    monkeypatch.setattr(ba, "_sampled_frames", lambda src, s, e, st: iter(frames.items()))
+    part = tmp_path / "chunk-00000.jsonl"
+    res = ba._process_chunk({
+        "index": 0, "source": "x.mp4", "start": 0, "end": 5, "stride": 2, "fps": 10.0,
+        "batch_size": 2, "conf": 0.25, "camera_id": "cam", "part_path": str(part),
+    })
+    rows = [json.loads(l) for l in part.read_text(encoding="utf-8").splitlines()]
+    assert [(r["frame"], r["count"], r["video_ts"]) for r in rows] == [(0, 1, 0.0), (4, 3, 0.4)]
+    assert res["frames"] == 3 and res["failed_frames"] == 1
+    assert res["video_seconds"] == 0.5
+
+
+def test_init_worker_fails_without_model(monkeypatch):
+    class NoModel(FakeEngine):
+        model = None
+
+    monkeypatch.setattr(ba, "InferenceEngine", NoModel)
+    with pytest.raises(RuntimeError):
+        ba._init_worker("yolov8n.pt", None, 1)
+
+
+@pytest.mark.parametrize("kwargs", [{"chunk_seconds": 0}, {"batch_size": 0}, {"workers": 0}])
+def test_run_batch_job_rejects_bad_inputs(tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        ba.run_batch_job("missing.mp4", str(tmp_path / "out.jsonl"), **kwargs)
+
+
+# --- engine ----------------------------------------------------------------
+
+def _box(cls, conf):
+    return types.SimpleNamespace(cls=cls, conf=conf, xyxy=[types.SimpleNamespace(tolist=lambda: [1.0, 2.0, 3.0, 4.0])])
+
+
+def test_summarize_filters_people_by_confidence():
+    result = types.SimpleNamespace(
+        names={0: "person", 43: "knife"},
+        boxes=[_box(0, 0.9), _box(0, 0.4), _box(43, 0.3)],
+    )
+    summary = InferenceEngine._summarize(result, person_conf=0.5)
+    assert summary["count"] == 1
+    assert [d["label"] for d in summary["detections"]] == ["person", "person", "knife"]
+    assert InferenceEngine._summarize(result)["count"] == 2